@@ -1,40 +1,176 @@
 import streamlit as st
 import requests
-import json
-from datetime import datetime
-import threading
-import subprocess
-import time
-import sys
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+BACKEND_URL = "http://localhost:8000"
+DEFAULT_TIMEOUT = 5
+BACKEND_PID_FILE = "backend.pid"
+BACKEND_LOG_FILE = "backend.log"
+
+# Static setup instructions, built once at import instead of on every rerun
+OAUTH_SETUP_MD = """
+### OAuth2 Setup (Quick & Easy)
+
+1. **Go to Google Cloud Console**
+   - Visit [console.cloud.google.com](https://console.cloud.google.com)
+   - Create a new project or select existing one
+
+2. **Enable Calendar API**
+   - Go to "APIs & Services" → "Library"
+   - Search for "Google Calendar API"
+   - Click "Enable"
+
+3. **Create OAuth2 Credentials**
+   - Go to "APIs & Services" → "Credentials"
+   - Click "Create Credentials" → "OAuth client ID"
+   - Configure consent screen if prompted (choose "External")
+   - Select "Desktop application"
+   - Name it "AI Booking Assistant"
+   - Click "Create"
+
+4. **Download and Upload**
+   - Download the JSON credentials file
+   - Upload it here with the exact name `client_secrets.json`
+"""
+
+SERVICE_ACCOUNT_SETUP_MD = """
+### Service Account Setup (Advanced)
+
+1. **Create Service Account**
+   - Go to "IAM & Admin" → "Service Accounts"
+   - Click "Create Service Account"
+   - Name: `ai-booking-assistant`
+   - Create and download JSON key file
+
+2. **Share Calendar**
+   - Find service account email in the JSON file
+   - Share your Google Calendar with this email
+   - Grant "Make changes to events" permission
+
+3. **Upload Credentials**
+   - Upload the service account JSON file as `credentials.json`
+"""
+
+class BackendSession(requests.Session):
+    """HTTP session that resolves paths against the backend URL and applies a default timeout"""
+    
+    def request(self, method, url, **kwargs):
+        if url.startswith("/"):
+            url = BACKEND_URL + url
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+class ChatStreamError(Exception):
+    """Raised when the backend reports an error in the chat stream"""
+
+# Share one keep-alive connection pool to the backend across reruns
+@st.cache_resource
+def get_http():
+    """Get the shared HTTP session for backend calls"""
+    session = BackendSession()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        # Connect failures are not retried so startup polling stays responsive
+        max_retries=Retry(total=2, connect=0, backoff_factor=0.2)
+    )
+    session.mount("http://", adapter)
+    return session
+
+def is_backend_process(pid):
+    """Check that a PID belongs to a running (not zombie) backend.py process"""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().split(b"\0")
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            state = f.read().rsplit(b")", 1)[1].split()[0]
+    except FileNotFoundError:
+        if os.path.isdir("/proc"):
+            return False  # No such process
+        # No procfs (e.g. macOS); signal 0 only checks that the process exists
+        os.kill(pid, 0)
+        return True
+    return state != b"Z" and any(os.path.basename(arg) == b"backend.py" for arg in cmdline)
+
+def read_backend_pid():
+    """Get the PID of a live backend daemon from the PID file, if any"""
+    try:
+        with open(BACKEND_PID_FILE) as f:
+            pid = int(f.read().strip())
+        if is_backend_process(pid):
+            return pid
+    except (OSError, ValueError):
+        pass
+    
+    # The backend has exited or its PID was reused; drop the stale file
+    try:
+        os.remove(BACKEND_PID_FILE)
+    except OSError:
+        pass
+    return None
+
+# Shared worker pool for overlapping independent backend requests
+@st.cache_resource
+def get_executor():
+    """Get the shared thread pool for concurrent backend calls"""
+    return ThreadPoolExecutor(max_workers=4)
+
 # Start FastAPI backend if not already running
 @st.cache_resource
 def start_backend():
-    """Start the FastAPI backend server"""
+    """Start the FastAPI backend server, reusing an already running daemon"""
+    # Only needed on cold start; this function is cached after the first run
+    import random
+    import subprocess
+    import sys
+    import time
+    
     try:
         # Check if backend is already running
-        response = requests.get("http://localhost:8000/health", timeout=1)
+        response = get_http().get("/health", timeout=1)
         if response.status_code == 200:
             return True
-    except:
+    except requests.exceptions.RequestException:
         pass
     
-    # Start backend in a separate process
-    def run_backend():
-        subprocess.run([sys.executable, "backend.py"], cwd=os.getcwd())
-    
-    thread = threading.Thread(target=run_backend, daemon=True)
-    thread.start()
+    # Start backend as a detached daemon so it outlives this Streamlit process,
+    # unless a daemon from an earlier run is still starting up
+    process = None
+    if read_backend_pid() is None:
+        with open(BACKEND_LOG_FILE, "ab") as log_file:
+            process = subprocess.Popen(
+                [sys.executable, "backend.py"],
+                cwd=os.getcwd(),
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                close_fds=True
+            )
+        with open(BACKEND_PID_FILE, "w") as f:
+            f.write(str(process.pid))
     
-    # Wait for backend to start
-    for _ in range(30):  # Wait up to 30 seconds
+    # Wait for backend to start, backing off from 50ms up to 1s between polls
+    deadline = time.monotonic() + 30  # Wait up to 30 seconds
+    delay = 0.05
+    while time.monotonic() < deadline:
         try:
-            response = requests.get("http://localhost:8000/health", timeout=1)
+            response = get_http().get("/health", timeout=0.5)
             if response.status_code == 200:
                 return True
-        except:
-            time.sleep(1)
+        except requests.exceptions.RequestException:
+            pass
+        # Stop waiting once the backend has died instead of polling it for 30s
+        exited = process.poll() is not None if process is not None else read_backend_pid() is None
+        if exited:
+            break
+        time.sleep(delay + random.uniform(0, delay * 0.2))
+        delay = min(delay * 2, 1.0)
     
     return False
 
@@ -58,15 +194,17 @@ def main():
             st.error("Failed to start backend service. Please try refreshing the page.")
             return
         
-        # Initialize session state
+        # Initialize session state, resuming the conversation from the URL if present
         if "messages" not in st.session_state:
             st.session_state.messages = []
-            st.session_state.conversation_id = None
+            st.session_state.conversation_id = st.query_params.get("cid")
         
         render_chat_interface()
     
     with tab2:
         render_calendar_setup()
+    
+    render_sidebar()
 
 def render_chat_interface():
     # Display chat messages
@@ -81,36 +219,23 @@ def render_chat_interface():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get AI response
+        # Get AI response, rendering it as it streams in
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    response = requests.post(
-                        "http://localhost:8000/chat",
-                        json={
-                            "message": prompt,
-                            "conversation_id": st.session_state.conversation_id
-                        },
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        assistant_message = data["response"]
-                        st.session_state.conversation_id = data["conversation_id"]
-                        
-                        st.markdown(assistant_message)
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": assistant_message
-                        })
-                    else:
-                        error_msg = "Sorry, I encountered an error. Please try again."
-                        st.markdown(error_msg)
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": error_msg
-                        })
+                    assistant_message = st.write_stream(stream_chat(prompt))
+                    st.session_state.messages.append({
+                        "role": "assistant", 
+                        "content": assistant_message
+                    })
+                
+                except (requests.exceptions.HTTPError, ChatStreamError):
+                    error_msg = "Sorry, I encountered an error. Please try again."
+                    st.markdown(error_msg)
+                    st.session_state.messages.append({
+                        "role": "assistant", 
+                        "content": error_msg
+                    })
                         
                 except requests.exceptions.RequestException as e:
                     error_msg = "Sorry, I'm having trouble connecting. Please try again."
@@ -120,37 +245,77 @@ def render_chat_interface():
                         "content": error_msg
                     })
 
+def stream_chat(prompt):
+    """Send a chat message and yield the assistant reply as it streams in"""
+    with get_http().post(
+        "/chat/stream",
+        data=orjson.dumps({
+            "message": prompt,
+            "conversation_id": st.session_state.conversation_id
+        }),
+        headers={"Content-Type": "application/json"},
+        stream=True,
+        timeout=(5, 60)
+    ) as response:
+        response.raise_for_status()
+        
+        # Parse server-sent events: "event: <name>" followed by "data: <json>"
+        event = None
+        for line in response.iter_lines():
+            if line.startswith(b"event: "):
+                event = line[7:].decode()
+            elif line.startswith(b"data: "):
+                data = orjson.loads(line[6:])
+                if event == "meta":
+                    st.session_state.conversation_id = data["conversation_id"]
+                    if st.query_params.get("cid") != data["conversation_id"]:
+                        st.query_params["cid"] = data["conversation_id"]
+                elif event == "message":
+                    yield data["text"]
+                elif event == "error":
+                    raise ChatStreamError(data["detail"])
+
+@st.cache_data(ttl=5)
+def get_credential_status(dir_mtime):
+    """Check which Google credential files are present"""
+    return (
+        os.path.exists('credentials.json'),
+        os.path.exists('client_secrets.json'),
+        os.path.exists('token.json')
+    )
+
+@st.cache_data(ttl=10)
+def fetch_conversations():
+    """Fetch recent conversations from the backend"""
+    response = get_http().get("/conversations")
+    response.raise_for_status()
+    return orjson.loads(response.content)["conversations"]
+
+@st.cache_data(ttl=10)
+def fetch_bookings():
+    """Fetch recent bookings from the backend"""
+    response = get_http().get("/bookings")
+    response.raise_for_status()
+    return orjson.loads(response.content)["bookings"]
+
 def render_calendar_setup():
     st.title("📅 Calendar Setup")
     st.markdown("Connect your Google Calendar to enable real appointment booking")
     
-    # Check current status
-    import os
-    has_service_account = os.path.exists('credentials.json')
-    has_oauth_secrets = os.path.exists('client_secrets.json')
-    has_oauth_token = os.path.exists('token.json')
+    # Check current status (re-checked only when the project directory changes)
+    has_service_account, has_oauth_secrets, has_oauth_token = get_credential_status(
+        os.stat('.').st_mtime
+    )
     
     # Status indicators
     st.subheader("📊 Current Status")
     
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        if has_service_account:
-            st.success("✅ Service Account Found")
-        else:
-            st.info("❌ No Service Account")
-    
-    with col2:
-        if has_oauth_secrets:
-            st.success("✅ OAuth Secrets Found")
-        else:
-            st.info("❌ No OAuth Secrets")
-    
-    with col3:
-        if has_oauth_token:
-            st.success("✅ OAuth Token Found")
-        else:
-            st.info("❌ No OAuth Token")
+    status_lines = [
+        "✅ Service Account Found" if has_service_account else "❌ No Service Account",
+        "✅ OAuth Secrets Found" if has_oauth_secrets else "❌ No OAuth Secrets",
+        "✅ OAuth Token Found" if has_oauth_token else "❌ No OAuth Token",
+    ]
+    st.markdown(" &nbsp;&nbsp;|&nbsp;&nbsp; ".join(status_lines), unsafe_allow_html=True)
     
     # Integration status
     if has_service_account or (has_oauth_secrets and has_oauth_token):
@@ -172,30 +337,7 @@ def render_calendar_setup():
     )
     
     if setup_option == "OAuth2 (Recommended for personal use)":
-        st.markdown("""
-        ### OAuth2 Setup (Quick & Easy)
-        
-        1. **Go to Google Cloud Console**
-           - Visit [console.cloud.google.com](https://console.cloud.google.com)
-           - Create a new project or select existing one
-        
-        2. **Enable Calendar API**
-           - Go to "APIs & Services" → "Library"
-           - Search for "Google Calendar API"
-           - Click "Enable"
-        
-        3. **Create OAuth2 Credentials**
-           - Go to "APIs & Services" → "Credentials"
-           - Click "Create Credentials" → "OAuth client ID"
-           - Configure consent screen if prompted (choose "External")
-           - Select "Desktop application"
-           - Name it "AI Booking Assistant"
-           - Click "Create"
-        
-        4. **Download and Upload**
-           - Download the JSON credentials file
-           - Upload it here with the exact name `client_secrets.json`
-        """)
+        st.markdown(OAUTH_SETUP_MD)
         
         uploaded_file = st.file_uploader(
             "Upload your client_secrets.json file:",
@@ -205,39 +347,23 @@ def render_calendar_setup():
         
         if uploaded_file is not None:
             try:
-                import json
-                content = json.loads(uploaded_file.getvalue().decode("utf-8"))
+                raw = uploaded_file.getvalue()
+                content = orjson.loads(raw)
                 
                 # Validate it's an OAuth2 client secrets file
                 if "installed" in content or "web" in content:
-                    with open("client_secrets.json", "w") as f:
-                        f.write(uploaded_file.getvalue().decode("utf-8"))
+                    with open("client_secrets.json", "wb") as f:
+                        f.write(raw)
                     st.success("✅ OAuth2 credentials saved successfully!")
                     st.info("💡 When you make your first booking request, a browser window will open for authentication.")
                     st.experimental_rerun()
                 else:
                     st.error("❌ Invalid OAuth2 credentials file. Please check the file format.")
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 st.error("❌ Invalid JSON file. Please upload a valid credentials file.")
     
     else:  # Service Account
-        st.markdown("""
-        ### Service Account Setup (Advanced)
-        
-        1. **Create Service Account**
-           - Go to "IAM & Admin" → "Service Accounts"
-           - Click "Create Service Account"
-           - Name: `ai-booking-assistant`
-           - Create and download JSON key file
-        
-        2. **Share Calendar**
-           - Find service account email in the JSON file
-           - Share your Google Calendar with this email
-           - Grant "Make changes to events" permission
-        
-        3. **Upload Credentials**
-           - Upload the service account JSON file as `credentials.json`
-        """)
+        st.markdown(SERVICE_ACCOUNT_SETUP_MD)
         
         uploaded_file = st.file_uploader(
             "Upload your credentials.json file:",
@@ -247,13 +373,13 @@ def render_calendar_setup():
         
         if uploaded_file is not None:
             try:
-                import json
-                content = json.loads(uploaded_file.getvalue().decode("utf-8"))
+                raw = uploaded_file.getvalue()
+                content = orjson.loads(raw)
                 
                 # Validate it's a service account file
                 if "type" in content and content["type"] == "service_account":
-                    with open("credentials.json", "w") as f:
-                        f.write(uploaded_file.getvalue().decode("utf-8"))
+                    with open("credentials.json", "wb") as f:
+                        f.write(raw)
                     st.success("✅ Service account credentials saved!")
                     
                     # Show service account email for calendar sharing
@@ -262,7 +388,7 @@ def render_calendar_setup():
                     st.experimental_rerun()
                 else:
                     st.error("❌ Invalid service account file. Please check the file format.")
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 st.error("❌ Invalid JSON file. Please upload a valid credentials file.")
     
     # Test connection button
@@ -271,28 +397,34 @@ def render_calendar_setup():
         if st.button("Test Google Calendar Connection"):
             with st.spinner("Testing connection..."):
                 try:
-                    response = requests.get("http://localhost:8000/health")
+                    # Check backend health and availability (this will test calendar
+                    # connection) concurrently, since the requests are independent
+                    today = date.today()
+                    tomorrow = (today + timedelta(days=1)).isoformat()
+                    day_after = (today + timedelta(days=2)).isoformat()
+                    
+                    health_future = get_executor().submit(get_http().get, "/health")
+                    availability_future = get_executor().submit(
+                        get_http().get,
+                        "/calendar/availability",
+                        params={"start_date": tomorrow, "end_date": day_after}
+                    )
+                    
+                    response = health_future.result()
                     if response.status_code == 200:
                         st.success("✅ Backend is running")
                         
-                        # Try to get availability (this will test calendar connection)
-                        from datetime import datetime, timedelta
-                        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-                        day_after = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
-                        
-                        response = requests.get(
-                            f"http://localhost:8000/availability?start_date={tomorrow}&end_date={day_after}"
-                        )
-                        
+                        response = availability_future.result()
                         if response.status_code == 200:
                             st.success("✅ Google Calendar connection working!")
                         else:
                             st.error("❌ Calendar connection failed. Check your credentials.")
                     else:
                         st.error("❌ Backend service not responding")
-                except Exception as e:
+                except requests.exceptions.RequestException as e:
                     st.error(f"❌ Connection test failed: {str(e)}")
-    
+
+def render_sidebar():
     # Sidebar with helpful information and data views
     with st.sidebar:
         st.header("💡 Tips")
@@ -315,50 +447,68 @@ def render_calendar_setup():
         """)
         
         if st.button("Clear Conversation"):
+            if st.session_state.get("conversation_id"):
+                try:
+                    get_http().delete(
+                        f"/conversations/{st.session_state.conversation_id}"
+                    )
+                except requests.exceptions.RequestException:
+                    pass
+            st.query_params.pop("cid", None)
             st.session_state.messages = []
             st.session_state.conversation_id = None
             st.rerun()
         
         # Data views section
-        st.divider()
-        st.header("📊 Data Views")
-        
-        # Recent conversations
-        if st.button("View Recent Conversations"):
-            try:
-                response = requests.get("http://localhost:8000/conversations", timeout=5)
-                if response.status_code == 200:
-                    conversations = response.json()["conversations"]
-                    st.subheader("Recent Conversations")
-                    for conv in conversations[:5]:
-                        st.write(f"**ID:** {conv['id'][:8]}...")
-                        st.write(f"**Messages:** {conv['message_count']}")
-                        st.write(f"**Created:** {conv['created_at'][:10]}")
-                        if conv['last_message']:
-                            st.write(f"**Last:** {conv['last_message'][:50]}...")
-                        st.write("---")
-                else:
-                    st.error("Could not load conversations")
-            except:
-                st.error("Backend not available")
-        
-        # Recent bookings
-        if st.button("View Recent Bookings"):
-            try:
-                response = requests.get("http://localhost:8000/bookings", timeout=5)
-                if response.status_code == 200:
-                    bookings = response.json()["bookings"]
-                    st.subheader("Recent Bookings")
-                    for booking in bookings[:5]:
-                        st.write(f"**Title:** {booking['title']}")
-                        st.write(f"**Date:** {booking['start_time'][:10]}")
-                        st.write(f"**Time:** {booking['start_time'][11:16]}")
-                        st.write(f"**Status:** {booking['status']}")
-                        st.write("---")
-                else:
-                    st.error("Could not load bookings")
-            except:
-                st.error("Backend not available")
+        render_data_views()
+
+# Runs as a fragment so data-view clicks don't redraw the whole chat history
+@st.fragment
+def render_data_views():
+    st.divider()
+    st.header("📊 Data Views")
+    
+    if st.button("Refresh Data"):
+        fetch_conversations.clear()
+        fetch_bookings.clear()
+    
+    # Recent conversations
+    if st.button("View Recent Conversations"):
+        try:
+            conversations = fetch_conversations()
+            st.subheader("Recent Conversations")
+            entries = []
+            for conv in conversations[:5]:
+                lines = [
+                    f"**ID:** {conv['id'][:8]}...",
+                    f"**Messages:** {conv['message_count']}",
+                    f"**Created:** {conv['created_at'][:10]}",
+                ]
+                if conv['last_message']:
+                    lines.append(f"**Last:** {conv['last_message'][:50]}...")
+                entries.append("\n\n".join(lines))
+            st.markdown("\n\n---\n\n".join(entries))
+        except requests.exceptions.HTTPError:
+            st.error("Could not load conversations")
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            st.error("Backend not available")
+    
+    # Recent bookings
+    if st.button("View Recent Bookings"):
+        try:
+            bookings = fetch_bookings()
+            st.subheader("Recent Bookings")
+            st.markdown("\n\n---\n\n".join(
+                f"**Title:** {booking['title']}\n\n"
+                f"**Date:** {booking['start_time'][:10]}\n\n"
+                f"**Time:** {booking['start_time'][11:16]}\n\n"
+                f"**Status:** {booking['status']}"
+                for booking in bookings[:5]
+            ))
+        except requests.exceptions.HTTPError:
+            st.error("Could not load bookings")
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            st.error("Backend not available")
 
 if __name__ == "__main__":
     main()
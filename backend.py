@@ -1,24 +1,60 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 import uvicorn
 import os
+from contextlib import asynccontextmanager
 from langgraph_agent import BookingAgent
 from calendar_service import CalendarService
 from database import db_manager
 import uuid
 import logging
+import orjson
+import time
+import asyncio
+from collections import OrderedDict, deque
 from datetime import datetime
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Booking Assistant API")
+# Number of uvicorn worker processes
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "1"))
 
-# Initialize services
-calendar_service = CalendarService()
-booking_agent = BookingAgent(calendar_service, db_manager)
+# Services are created per worker process on startup
+calendar_service: Optional[CalendarService] = None
+booking_agent: Optional[BookingAgent] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize services when a worker process starts"""
+    global calendar_service, booking_agent
+    # Only a single worker may open a browser for OAuth login; with several
+    # workers each would start its own login flow and block startup
+    calendar_service = CalendarService(allow_oauth_flow=BACKEND_WORKERS == 1)
+    booking_agent = BookingAgent(calendar_service, db_manager)
+    yield
+
+# Endpoints that return an ORJSONResponse directly skip FastAPI's jsonable_encoder
+# pass, and orjson encodes their datetimes natively
+app = FastAPI(
+    title="AI Booking Assistant API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+# In-memory context (agent state + history) for active conversations, keyed by
+# conversation ID, so follow-up turns don't reload everything from the database.
+# Only used with a single worker, since other workers can't see updates to it.
+# Kept in least-recently-used order and bounded in size and idle time.
+session_contexts: "OrderedDict[str, Dict]" = OrderedDict()
+SESSION_CONTEXT_MAX = 10_000
+SESSION_CONTEXT_TTL = 3600  # seconds
+
+# Number of most recent messages passed to the agent as conversation history
+HISTORY_WINDOW = 20
 
 class ChatRequest(BaseModel):
     message: str
@@ -28,53 +64,130 @@ class ChatResponse(BaseModel):
     response: str
     conversation_id: str
 
-@app.get("/health")
-async def health_check():
+HEALTH_BODY = b'{"status":"healthy"}'
+
+async def health_check(request: Request) -> Response:
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return Response(HEALTH_BODY, media_type="application/json")
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Handle chat messages and return AI responses"""
+# Registered as a plain Starlette route, skipping FastAPI's validation and encoding
+app.add_route("/health", health_check, methods=["GET"], include_in_schema=False)
+
+def get_session_context(conversation_id: str) -> Optional[Dict]:
+    """Get a cached conversation context, dropping it if it has expired"""
+    context = session_contexts.get(conversation_id)
+    if context is None:
+        return None
+    now = time.monotonic()
+    if context["expires_at"] <= now:
+        del session_contexts[conversation_id]
+        return None
+    context["expires_at"] = now + SESSION_CONTEXT_TTL
+    session_contexts.move_to_end(conversation_id)
+    return context
+
+def store_session_context(conversation_id: str, context: Dict):
+    """Cache a conversation context, evicting the least recently used ones"""
+    context["expires_at"] = time.monotonic() + SESSION_CONTEXT_TTL
+    session_contexts[conversation_id] = context
+    session_contexts.move_to_end(conversation_id)
+    while len(session_contexts) > SESSION_CONTEXT_MAX:
+        session_contexts.popitem(last=False)
+
+async def load_session_context(conversation_id: Optional[str]) -> tuple:
+    """Get the in-memory context for a conversation, loading or creating it as needed"""
+    context = None
+    if conversation_id and BACKEND_WORKERS == 1:
+        context = get_session_context(conversation_id)
+    if context is not None:
+        return conversation_id, context
+    
+    # Load the conversation and its history from database concurrently
+    conversation = None
+    messages = []
+    if conversation_id:
+        conversation, messages = await asyncio.gather(
+            asyncio.to_thread(db_manager.get_conversation, conversation_id),
+            asyncio.to_thread(db_manager.get_conversation_messages, conversation_id),
+            return_exceptions=True
+        )
+        if isinstance(conversation, Exception):
+            raise conversation
+    
+    # Generate conversation ID if not provided or unknown
+    if not conversation:
+        conversation = await asyncio.to_thread(db_manager.create_conversation)
+        conversation_id = str(conversation.id)
+        messages = []
+    elif isinstance(messages, Exception):
+        raise messages
+    
+    conv_state = {}
+    if hasattr(conversation, 'state'):
+        conv_state = conversation.state if conversation.state is not None else {}
+    
+    context = {
+        "state": conv_state,
+        # (role, content) tuples rather than a dict per message
+        "history": deque(
+            ((msg.role, msg.content) for msg in messages[-HISTORY_WINDOW:]),
+            maxlen=HISTORY_WINDOW
+        )
+    }
+    if BACKEND_WORKERS == 1:
+        store_session_context(conversation_id, context)
+    return conversation_id, context
+
+async def run_chat_turn(conversation_id: str, context: Dict, message: str) -> str:
+    """Process one user message with the agent and persist the exchange"""
+    # Write the user message to database while the agent runs; it is awaited
+    # before the assistant message is written, so message order is preserved.
+    # The agent only needs the history before this message.
+    user_write = asyncio.create_task(
+        asyncio.to_thread(db_manager.add_message, conversation_id, "user", message)
+    )
+    
+    # Process message with LangGraph agent
     try:
-        # Generate conversation ID if not provided
-        if not request.conversation_id:
-            conversation = db_manager.create_conversation()
-            conversation_id = str(conversation.id)
-        else:
-            conversation_id = request.conversation_id
-            conversation = db_manager.get_conversation(conversation_id)
-            if not conversation:
-                conversation = db_manager.create_conversation()
-                conversation_id = str(conversation.id)
-        
-        # Add user message to database
-        db_manager.add_message(conversation_id, "user", request.message)
-        
-        # Get conversation history from database
-        messages = db_manager.get_conversation_messages(conversation_id)
-        history = [{"role": msg.role, "content": msg.content} for msg in messages]
-        
-        # Process message with LangGraph agent  
-        conv_state = {}
-        if conversation and hasattr(conversation, 'state'):
-            conv_state = conversation.state if conversation.state is not None else {}
-        
         response = await booking_agent.process_message(
-            message=request.message,
-            conversation_state=conv_state,
-            conversation_history=history,
+            message=message,
+            conversation_state=context["state"],
+            conversation_history=context["history"],
             conversation_id=conversation_id
         )
-        
-        # Update conversation state in database
-        db_manager.update_conversation_state(conversation_id, response.get("state", {}))
-        
-        # Add assistant response to database
-        db_manager.add_message(conversation_id, "assistant", response["message"])
+    finally:
+        # The agent may already have booked the appointment, so a failed write
+        # is logged rather than failing the turn or hiding the agent's error
+        try:
+            await user_write
+        except Exception as e:
+            logger.error(f"Error saving user message: {str(e)}")
+        else:
+            context["history"].append(("user", message))
+    
+    # Update conversation state and add assistant response in database
+    context["state"] = response.get("state", {})
+    await asyncio.gather(
+        asyncio.to_thread(db_manager.update_conversation_state, conversation_id, context["state"]),
+        asyncio.to_thread(db_manager.add_message, conversation_id, "assistant", response["message"])
+    )
+    context["history"].append(("assistant", response["message"]))
+    
+    return response["message"]
+
+def format_sse(event: str, data: Dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Handle chat messages and return AI responses"""
+    try:
+        conversation_id, context = await load_session_context(request.conversation_id)
+        reply = await run_chat_turn(conversation_id, context, request.message)
         
         return ChatResponse(
-            response=response["message"],
+            response=reply,
             conversation_id=conversation_id
         )
         
@@ -82,6 +195,28 @@ async def chat(request: ChatRequest):
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Handle chat messages and stream AI responses as server-sent events"""
+    try:
+        conversation_id, context = await load_session_context(request.conversation_id)
+    except Exception as e:
+        logger.error(f"Error processing chat request: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    async def events():
+        # Send the conversation ID first so the client can persist it right away
+        yield format_sse("meta", {"conversation_id": conversation_id})
+        try:
+            reply = await run_chat_turn(conversation_id, context, request.message)
+            yield format_sse("message", {"text": reply})
+        except Exception as e:
+            logger.error(f"Error processing chat request: {str(e)}")
+            yield format_sse("error", {"detail": "Internal server error"})
+        yield format_sse("done", {})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/calendar/availability")
 async def get_availability(start_date: str, end_date: str):
     """Get calendar availability for a date range"""
@@ -112,8 +247,11 @@ async def book_appointment(
         logger.error(f"Error booking appointment: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to book appointment")
 
+# Endpoints that only make blocking database calls are plain functions, so FastAPI
+# runs them in its threadpool instead of stalling the event loop
+
 @app.get("/conversations")
-async def get_conversations(limit: int = 10):
+def get_conversations(limit: int = 10):
     """Get recent conversation history"""
     try:
         conversations = db_manager.get_conversation_history(limit=limit)
@@ -122,29 +260,36 @@ async def get_conversations(limit: int = 10):
         logger.error(f"Error getting conversations: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get conversations")
 
+@app.delete("/conversations/{conversation_id}")
+async def clear_conversation(conversation_id: str):
+    """Release the in-memory context held for a conversation"""
+    session_contexts.pop(conversation_id, None)
+    booking_agent.memory.delete_thread(conversation_id)
+    return {"conversation_id": conversation_id, "status": "cleared"}
+
 @app.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str):
+def get_conversation_messages(conversation_id: str):
     """Get messages for a specific conversation"""
     try:
         messages = db_manager.get_conversation_messages(conversation_id)
-        return {
+        return ORJSONResponse({
             "conversation_id": conversation_id,
             "messages": [
                 {
                     "id": str(msg.id),
                     "role": msg.role,
                     "content": msg.content,
-                    "created_at": msg.created_at.isoformat()
+                    "created_at": msg.created_at
                 }
                 for msg in messages
             ]
-        }
+        })
     except Exception as e:
         logger.error(f"Error getting conversation messages: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get messages")
 
 @app.get("/bookings")
-async def get_bookings(start_date: str = None, end_date: str = None):
+def get_bookings(start_date: str = None, end_date: str = None):
     """Get booking records"""
     try:
         if start_date and end_date:
@@ -159,20 +304,20 @@ async def get_bookings(start_date: str = None, end_date: str = None):
                     Booking.status == "confirmed"
                 ).order_by(Booking.start_time.desc()).limit(20).all()
         
-        return {
+        return ORJSONResponse({
             "bookings": [
                 {
                     "id": str(booking.id),
                     "title": booking.title,
                     "description": booking.description,
-                    "start_time": booking.start_time.isoformat(),
-                    "end_time": booking.end_time.isoformat(),
+                    "start_time": booking.start_time,
+                    "end_time": booking.end_time,
                     "status": booking.status,
-                    "created_at": booking.created_at.isoformat()
+                    "created_at": booking.created_at
                 }
                 for booking in bookings
             ]
-        }
+        })
     except Exception as e:
         logger.error(f"Error getting bookings: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get bookings")
@@ -183,5 +328,9 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=False,
-        log_level="info"
+        workers=BACKEND_WORKERS,
+        loop="auto",  # uvloop when installed, asyncio otherwise
+        http="auto",  # httptools when installed, h11 otherwise
+        log_level="warning",
+        access_log=False
     )
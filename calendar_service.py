@@ -1,5 +1,10 @@
 import os
 import json
+import asyncio
+import threading
+import time
+import uuid
+from bisect import bisect_right
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import logging
@@ -9,22 +14,45 @@ from google.oauth2 import service_account
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+import google_auth_httplib2
+import httplib2
 
 logger = logging.getLogger(__name__)
 
+ONE_DAY = timedelta(days=1)
+
+# Bookable slots on each weekday, as offsets from midnight
+SLOT_OFFSETS = (
+    (timedelta(hours=9), timedelta(hours=12)),   # Morning: 9 AM - 12 PM
+    (timedelta(hours=14), timedelta(hours=17)),  # Afternoon: 2 PM - 5 PM
+)
+
 class CalendarService:
     """Google Calendar integration service"""
     
     SCOPES = ['https://www.googleapis.com/auth/calendar']
+    AVAILABILITY_CACHE_TTL = 30  # seconds
+    AVAILABILITY_CACHE_SIZE = 256
+    # Touched when an event is created so every worker process drops its cache
+    AVAILABILITY_STAMP_FILE = '.availability_stamp'
     
-    def __init__(self):
+    def __init__(self, allow_oauth_flow: bool = True):
+        # Whether an interactive OAuth browser flow may run when no token is available
+        self.allow_oauth_flow = allow_oauth_flow
         self.service = None
+        self.credentials = None
+        # Per worker thread authorized HTTP clients for API requests
+        self._thread_local = threading.local()
+        # (start_date, end_date) -> (expires_at, slots)
+        self._availability_cache: Dict[tuple, tuple] = {}
+        self._availability_stamp_seen = self._availability_stamp()
         self._initialize_service()
     
     def _initialize_service(self):
         """Initialize Google Calendar service with authentication"""
         try:
             creds = None
+            token_changed = False
             
             # Try service account authentication first
             if os.path.exists('credentials.json'):
@@ -47,17 +75,26 @@ class CalendarService:
                     if creds and creds.expired and creds.refresh_token:
                         try:
                             creds.refresh(Request())
+                            token_changed = True
                             logger.info("OAuth credentials refreshed successfully")
                         except Exception as e:
                             logger.warning(f"Failed to refresh credentials: {str(e)}")
                             creds = None
                     
-                    if (not creds or not creds.valid) and os.path.exists('client_secrets.json'):
+                    if creds and creds.valid:
+                        pass
+                    elif os.path.exists('client_secrets.json') and not self.allow_oauth_flow:
+                        logger.warning("OAuth token missing or invalid and interactive login is disabled. Using mock service.")
+                        logger.info("Start the backend once with a single worker to complete the OAuth login and create 'token.json'")
+                        self.service = None
+                        return
+                    elif os.path.exists('client_secrets.json'):
                         # Run OAuth flow if client secrets available
                         flow = InstalledAppFlow.from_client_secrets_file(
                             'client_secrets.json', self.SCOPES
                         )
                         creds = flow.run_local_server(port=0)
+                        token_changed = True
                     else:
                         logger.warning("No Google Calendar credentials found. Using mock service.")
                         logger.info("To use real Google Calendar:")
@@ -67,18 +104,39 @@ class CalendarService:
                         return
             
             if creds:
-                # Save OAuth credentials for the next run (not needed for service account)
-                if hasattr(creds, 'to_json') and not isinstance(creds, service_account.Credentials):
+                # Save new or refreshed OAuth credentials for the next run
+                # (not needed for service account or an unchanged token)
+                if token_changed:
                     with open('token.json', 'w') as token:
                         token.write(creds.to_json())
                 
-                self.service = build('calendar', 'v3', credentials=creds)
+                self.credentials = creds
+                # Use the discovery document bundled with the client library
+                # instead of fetching and caching it over the network
+                self.service = build(
+                    'calendar', 'v3', credentials=creds,
+                    static_discovery=True, cache_discovery=False
+                )
                 logger.info("Google Calendar service initialized successfully")
             
         except Exception as e:
             logger.error(f"Failed to initialize Google Calendar service: {str(e)}")
             self.service = None
     
+    async def _execute(self, request):
+        """Execute a Google API request in a worker thread so it doesn't block the event loop"""
+        return await asyncio.to_thread(self._execute_in_thread, request)
+    
+    def _execute_in_thread(self, request):
+        """Execute a Google API request with the current thread's authorized client"""
+        # httplib2 is not thread-safe, so each worker thread keeps its own client,
+        # reusing its keep-alive connection across requests
+        http = getattr(self._thread_local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._thread_local.http = http
+        return request.execute(http=http)
+    
     async def get_availability(self, start_date: str, end_date: str) -> List[Dict]:
         """Get available time slots between start_date and end_date"""
         try:
@@ -86,18 +144,30 @@ class CalendarService:
                 # Mock response for demo purposes
                 return self._get_mock_availability(start_date, end_date)
             
+            # Drop the cache if an event was created by any worker since last check
+            stamp = self._availability_stamp()
+            if stamp != self._availability_stamp_seen:
+                self._availability_cache.clear()
+                self._availability_stamp_seen = stamp
+            
+            # Serve repeated lookups of the same range from the cache
+            cache_key = (start_date, end_date)
+            cached = self._availability_cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                return list(cached[1])
+            
             # Convert string dates to RFC3339 format
             start_datetime = datetime.fromisoformat(start_date).isoformat() + 'Z'
             end_datetime = datetime.fromisoformat(end_date).isoformat() + 'Z'
             
             # Get events from primary calendar
-            events_result = self.service.events().list(
+            events_result = await self._execute(self.service.events().list(
                 calendarId='primary',
                 timeMin=start_datetime,
                 timeMax=end_datetime,
                 singleEvents=True,
                 orderBy='startTime'
-            ).execute()
+            ))
             
             events = events_result.get('items', [])
             
@@ -106,7 +176,8 @@ class CalendarService:
                 events, start_date, end_date
             )
             
-            return available_slots
+            self._cache_availability(cache_key, available_slots)
+            return list(available_slots)
             
         except HttpError as e:
             logger.error(f"Google Calendar API error: {str(e)}")
@@ -141,10 +212,14 @@ class CalendarService:
                 },
             }
             
-            created_event = self.service.events().insert(
+            created_event = await self._execute(self.service.events().insert(
                 calendarId='primary', 
                 body=event
-            ).execute()
+            ))
+            
+            # Cached availability no longer reflects the calendar, here or in other workers
+            self._availability_cache.clear()
+            self._touch_availability_stamp()
             
             return {
                 'id': created_event['id'],
@@ -161,6 +236,35 @@ class CalendarService:
             logger.error(f"Error creating event: {str(e)}")
             raise Exception(f"Failed to create calendar event: {str(e)}")
     
+    def _availability_stamp(self) -> int:
+        """Get the modification time of the shared availability stamp file"""
+        try:
+            return os.stat(self.AVAILABILITY_STAMP_FILE).st_mtime_ns
+        except OSError:
+            return 0
+    
+    def _touch_availability_stamp(self):
+        """Signal all worker processes that cached availability is stale"""
+        try:
+            with open(self.AVAILABILITY_STAMP_FILE, 'a'):
+                pass
+            os.utime(self.AVAILABILITY_STAMP_FILE)
+            self._availability_stamp_seen = self._availability_stamp()
+        except OSError as e:
+            logger.warning(f"Failed to update availability stamp: {str(e)}")
+    
+    def _cache_availability(self, key: tuple, slots: List[Dict]):
+        """Store availability for a date range, evicting stale or oldest entries"""
+        now = time.monotonic()
+        if len(self._availability_cache) >= self.AVAILABILITY_CACHE_SIZE:
+            self._availability_cache = {
+                k: v for k, v in self._availability_cache.items() if v[0] > now
+            }
+            if len(self._availability_cache) >= self.AVAILABILITY_CACHE_SIZE:
+                # Dicts keep insertion order, so the first key is the oldest entry
+                del self._availability_cache[next(iter(self._availability_cache))]
+        self._availability_cache[key] = (now + self.AVAILABILITY_CACHE_TTL, slots)
+    
     def _get_mock_availability(self, start_date: str, end_date: str) -> List[Dict]:
         """Generate mock availability for demo purposes"""
         try:
@@ -168,34 +272,13 @@ class CalendarService:
             end = datetime.fromisoformat(end_date)
             
             available_slots = []
-            current = start
-            
-            while current < end:
-                # Skip weekends
-                if current.weekday() < 5:  # Monday = 0, Friday = 4
-                    # Add morning slot (9 AM - 12 PM)
-                    morning_start = current.replace(hour=9, minute=0, second=0, microsecond=0)
-                    morning_end = current.replace(hour=12, minute=0, second=0, microsecond=0)
-                    
-                    if morning_start >= start and morning_end <= end:
-                        available_slots.append({
-                            'start': morning_start.isoformat(),
-                            'end': morning_end.isoformat(),
-                            'type': 'available'
-                        })
-                    
-                    # Add afternoon slot (2 PM - 5 PM)
-                    afternoon_start = current.replace(hour=14, minute=0, second=0, microsecond=0)
-                    afternoon_end = current.replace(hour=17, minute=0, second=0, microsecond=0)
-                    
-                    if afternoon_start >= start and afternoon_end <= end:
-                        available_slots.append({
-                            'start': afternoon_start.isoformat(),
-                            'end': afternoon_end.isoformat(),
-                            'type': 'available'
-                        })
-                
-                current += timedelta(days=1)
+            for slot_start, slot_end in self._weekday_slots(start, end):
+                if slot_start >= start and slot_end <= end:
+                    available_slots.append({
+                        'start': slot_start.isoformat(),
+                        'end': slot_end.isoformat(),
+                        'type': 'available'
+                    })
             
             return available_slots
             
@@ -205,14 +288,14 @@ class CalendarService:
     
     def _create_mock_event(self, title: str, start_time: str, end_time: str, description: str) -> Dict:
         """Create a mock event response for demo purposes"""
-        import uuid
+        event_id = uuid.uuid4()
         return {
-            'id': str(uuid.uuid4()),
+            'id': str(event_id),
             'title': title,
             'start_time': start_time,
             'end_time': end_time,
             'description': description,
-            'html_link': f"https://calendar.google.com/calendar/event?eid={uuid.uuid4()}"
+            'html_link': f"https://calendar.google.com/calendar/event?eid={event_id.hex}"
         }
     
     def _calculate_available_slots(
@@ -239,35 +322,25 @@ class CalendarService:
                     )
                     busy_times.append((event_start, event_end))
             
+            # Sort and merge busy intervals so each slot check is a binary search
+            busy_times.sort()
+            merged_busy = []
+            for busy_start, busy_end in busy_times:
+                if merged_busy and busy_start <= merged_busy[-1][1]:
+                    merged_busy[-1] = (merged_busy[-1][0], max(merged_busy[-1][1], busy_end))
+                else:
+                    merged_busy.append((busy_start, busy_end))
+            busy_ends = [busy_end for _, busy_end in merged_busy]
+            
             # Generate available slots (simplified logic)
             available_slots = []
-            current = start
-            
-            while current < end:
-                if current.weekday() < 5:  # Weekdays only
-                    # Check morning slot
-                    morning_start = current.replace(hour=9, minute=0, second=0, microsecond=0)
-                    morning_end = current.replace(hour=12, minute=0, second=0, microsecond=0)
-                    
-                    if not self._is_time_busy(morning_start, morning_end, busy_times):
-                        available_slots.append({
-                            'start': morning_start.isoformat(),
-                            'end': morning_end.isoformat(),
-                            'type': 'available'
-                        })
-                    
-                    # Check afternoon slot
-                    afternoon_start = current.replace(hour=14, minute=0, second=0, microsecond=0)
-                    afternoon_end = current.replace(hour=17, minute=0, second=0, microsecond=0)
-                    
-                    if not self._is_time_busy(afternoon_start, afternoon_end, busy_times):
-                        available_slots.append({
-                            'start': afternoon_start.isoformat(),
-                            'end': afternoon_end.isoformat(),
-                            'type': 'available'
-                        })
-                
-                current += timedelta(days=1)
+            for slot_start, slot_end in self._weekday_slots(start, end):
+                if not self._is_time_busy(slot_start, slot_end, merged_busy, busy_ends):
+                    available_slots.append({
+                        'start': slot_start.isoformat(),
+                        'end': slot_end.isoformat(),
+                        'type': 'available'
+                    })
             
             return available_slots
             
@@ -275,9 +348,24 @@ class CalendarService:
             logger.error(f"Error calculating available slots: {str(e)}")
             return []
     
-    def _is_time_busy(self, start: datetime, end: datetime, busy_times: List[tuple]) -> bool:
-        """Check if a time slot conflicts with busy times"""
-        for busy_start, busy_end in busy_times:
-            if (start < busy_end and end > busy_start):
-                return True
-        return False
+    def _weekday_slots(self, start: datetime, end: datetime):
+        """Yield business-hour slots for each weekday from start's date until end"""
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        # One step per day while start + n days < end (ceiling division)
+        for _ in range(-((start - end) // ONE_DAY)):
+            if day.weekday() < 5:  # Monday = 0, Friday = 4
+                for start_offset, end_offset in SLOT_OFFSETS:
+                    yield day + start_offset, day + end_offset
+            day += ONE_DAY
+    
+    def _is_time_busy(
+        self, 
+        start: datetime, 
+        end: datetime, 
+        merged_busy: List[tuple], 
+        busy_ends: List[datetime]
+    ) -> bool:
+        """Check if a time slot conflicts with sorted, non-overlapping busy times"""
+        # First busy interval that ends after the slot starts is the only candidate
+        i = bisect_right(busy_ends, start)
+        return i < len(merged_busy) and merged_busy[i][0] < end
@@ -1,12 +1,17 @@
 import json
 import os
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Sequence, Tuple
 import logging
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel
 import re
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from operator import itemgetter
 from utils import parse_natural_language_datetime, extract_duration, format_datetime_natural
 from google import genai
 from google.genai import types
@@ -20,6 +25,126 @@ if GEMINI_API_KEY:
 else:
     gemini_client = None
 
+# Most conversation threads whose checkpoints are kept in memory
+CHECKPOINT_MAX_THREADS = 10_000
+
+class BoundedMemorySaver(MemorySaver):
+    """In-memory checkpointer that keeps the latest checkpoint of the most recently used threads"""
+    
+    def __init__(self, max_threads: int = CHECKPOINT_MAX_THREADS):
+        super().__init__()
+        self.max_threads = max_threads
+        # Per thread, in least recently used order: the writes and blob keys it
+        # owns, so deleting a thread doesn't scan the entries of every other one
+        self._thread_keys: "OrderedDict[str, Tuple[set, set]]" = OrderedDict()
+    
+    def _use_thread(self, thread_id: str) -> Tuple[set, set]:
+        """Mark a thread as most recently used, evicting the stalest threads over the limit"""
+        keys = self._thread_keys.get(thread_id)
+        if keys is None:
+            keys = self._thread_keys[thread_id] = (set(), set())
+        self._thread_keys.move_to_end(thread_id)
+        while len(self._thread_keys) > self.max_threads:
+            self.delete_thread(next(iter(self._thread_keys)))
+        return keys
+    
+    def put(self, config, checkpoint, metadata, new_versions):
+        """Save a checkpoint, dropping the thread's earlier checkpoints"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        write_keys, blob_keys = self._use_thread(thread_id)
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        blob_keys.update((thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items())
+        
+        # Turns only resume from the latest checkpoint, so earlier ones, their
+        # pending writes and channel values it no longer references are dropped
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [key for key in checkpoints if key != checkpoint["id"]]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        for key in [key for key in write_keys if key[1] == checkpoint_ns and key[2] != checkpoint["id"]]:
+            write_keys.discard(key)
+            self.writes.pop(key, None)
+        channel_versions = checkpoint["channel_versions"]
+        for key in [key for key in blob_keys if key[1] == checkpoint_ns and channel_versions.get(key[2]) != key[3]]:
+            blob_keys.discard(key)
+            self.blobs.pop(key, None)
+        return saved
+    
+    def put_writes(self, config, writes, task_id, task_path=""):
+        """Save pending writes, indexing them under their thread"""
+        super().put_writes(config, writes, task_id, task_path)
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        write_keys, _ = self._use_thread(thread_id)
+        write_keys.add((thread_id, configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]))
+    
+    def delete_thread(self, thread_id: str):
+        """Delete all checkpoints and writes for a thread"""
+        write_keys, blob_keys = self._thread_keys.pop(thread_id, (set(), set()))
+        # Reading a checkpoint also creates an (empty) writes entry for it
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            write_keys.update((thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in checkpoints)
+        for key in write_keys:
+            self.writes.pop(key, None)
+        for key in blob_keys:
+            self.blobs.pop(key, None)
+
+# Checkpoints for every conversation thread, shared by the compiled graph
+CHECKPOINTER = BoundedMemorySaver()
+
+# The agent and conversation handling the current turn, set by process_message
+_current_agent: ContextVar["BookingAgent"] = ContextVar("current_agent")
+_current_conversation_id: ContextVar[str] = ContextVar("current_conversation_id", default="default")
+
+# Keyword rules that settle intent without a model call, checked in priority
+# order so e.g. "cancel my meeting" is a cancellation rather than a booking
+INTENT_RULES = (
+    (re.compile(r"\b(?:cancel|cancellation)\b", re.IGNORECASE), "cancellation"),
+    (re.compile(r"\b(?:reschedule|move|postpone)\b", re.IGNORECASE), "modification"),
+    (re.compile(r"\b(?:book|schedule|meeting|appointment|available|availability)\b", re.IGNORECASE), "booking"),
+)
+
+def _match_intent_rules(message: str) -> Optional[str]:
+    """Get the intent of a message from keyword rules, if any rule matches"""
+    for pattern, intent in INTENT_RULES:
+        if pattern.search(message):
+            return intent
+    return None
+
+# Confirmation replies are matched on whole words
+CONFIRM_WORDS = frozenset({"yes", "confirm", "book", "schedule", "ok", "okay", "sure"})
+DECLINE_WORDS = frozenset({"no", "different", "other", "change"})
+WORD_PATTERN = re.compile(r"[a-z]+")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+# Intent classifications keyed by normalized message: message -> (expires_at, result).
+# The classification prompt depends only on the message, so repeats skip Gemini.
+INTENT_CACHE_TTL = 300  # seconds
+INTENT_CACHE_SIZE = 1024
+
+# The classification reply is a small fixed-shape JSON object
+INTENT_MAX_OUTPUT_TOKENS = 100
+_intent_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _get_cached_intent(key: str) -> Optional[Dict]:
+    """Get a cached intent classification if it hasn't expired"""
+    entry = _intent_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _intent_cache[key]
+        return None
+    _intent_cache.move_to_end(key)
+    return entry[1]
+
+def _cache_intent(key: str, result: Dict):
+    """Cache an intent classification, evicting the least recently used ones"""
+    _intent_cache[key] = (time.monotonic() + INTENT_CACHE_TTL, result)
+    _intent_cache.move_to_end(key)
+    while len(_intent_cache) > INTENT_CACHE_SIZE:
+        _intent_cache.popitem(last=False)
+
 class ConversationState(BaseModel):
     """State model for conversation flow"""
     intent: Optional[str] = None
@@ -40,86 +165,14 @@ class BookingAgent:
     def __init__(self, calendar_service, db_manager=None):
         self.calendar_service = calendar_service
         self.db_manager = db_manager
-        self.memory = MemorySaver()
-        self.graph = self._build_graph()
-    
-    def _build_graph(self):
-        """Build the LangGraph conversation flow"""
-        workflow = StateGraph(ConversationState)
-        
-        # Add nodes
-        workflow.add_node("understand_intent", self._understand_intent)
-        workflow.add_node("parse_datetime", self._parse_datetime)
-        workflow.add_node("check_availability", self._check_availability)
-        workflow.add_node("suggest_slots", self._suggest_slots)
-        workflow.add_node("confirm_booking", self._confirm_booking)
-        workflow.add_node("book_appointment", self._book_appointment)
-        workflow.add_node("handle_error", self._handle_error)
-        
-        # Set entry point
-        workflow.set_entry_point("understand_intent")
-        
-        # Add edges
-        workflow.add_conditional_edges(
-            "understand_intent",
-            self._route_intent,
-            {
-                "parse_datetime": "parse_datetime",
-                "clarify": END,
-                "error": "handle_error"
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "parse_datetime",
-            self._route_datetime,
-            {
-                "check_availability": "check_availability",
-                "clarify_time": END,
-                "error": "handle_error"
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "check_availability",
-            self._route_availability,
-            {
-                "suggest_slots": "suggest_slots",
-                "no_availability": END,
-                "error": "handle_error"
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "suggest_slots",
-            self._route_suggestion,
-            {
-                "confirm_booking": "confirm_booking",
-                "alternative": "check_availability",
-                "clarify": END
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "confirm_booking",
-            self._route_confirmation,
-            {
-                "book_appointment": "book_appointment",
-                "modify": "parse_datetime",
-                "cancel": END
-            }
-        )
-        
-        workflow.add_edge("book_appointment", END)
-        workflow.add_edge("handle_error", END)
-        
-        return workflow.compile(checkpointer=self.memory)
+        self.memory = CHECKPOINTER
+        self.graph = COMPILED_GRAPH
     
     async def process_message(
         self, 
         message: str, 
         conversation_state: Dict, 
-        conversation_history: List[Dict],
+        conversation_history: Sequence[Tuple[str, str]],
         conversation_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Process a user message and return AI response"""
@@ -130,8 +183,10 @@ class BookingAgent:
                 **conversation_state
             )
             
-            # Store conversation ID for database operations
-            self._current_conversation_id = conversation_id or "default"
+            # Bind this agent and the conversation ID to the turn; the values are
+            # per task, so concurrent turns don't see each other's
+            _current_agent.set(self)
+            _current_conversation_id.set(conversation_id or "default")
             
             # Run the graph
             result = await self.graph.ainvoke(
@@ -170,34 +225,18 @@ class BookingAgent:
                     state.step = "clarify"
                 return state
             
-            prompt = f"""
-            Analyze this user message for booking intent: "{state.user_message}"
-            
-            Determine the intent and extract key information. Respond in JSON format:
-            {{
-                "intent": "booking|inquiry|modification|cancellation|other",
-                "has_date": true|false,
-                "has_time": true|false,
-                "urgency": "low|medium|high",
-                "meeting_type": "meeting|call|appointment|other"
-            }}
-            """
-            
-            response = gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.1
-                )
-            )
-            
-            content = response.text
-            if content:
-                result = json.loads(content)
-            else:
-                result = {"intent": "other"}
-            state.intent = result.get("intent", "other")
+            # Only ask Gemini when no keyword rule settles the intent
+            state.intent = _match_intent_rules(state.user_message)
+            if state.intent is None:
+                cache_key = " ".join(state.user_message.lower().split())
+                result = _get_cached_intent(cache_key)
+                if result is None:
+                    result = await self._classify_intent(state.user_message)
+                    if result is not None:
+                        _cache_intent(cache_key, result)
+                    else:
+                        result = {"intent": "other"}
+                state.intent = result.get("intent", "other")
             
             if state.intent == "booking":
                 state.step = "parse_datetime"
@@ -212,6 +251,37 @@ class BookingAgent:
             state.step = "error"
             return state
     
+    async def _classify_intent(self, message: str) -> Optional[Dict]:
+        """Classify a message's booking intent with Gemini"""
+        prompt = f"""
+        Analyze this user message for booking intent: "{message}"
+        
+        Determine the intent and extract key information. Respond in JSON format:
+        {{
+            "intent": "booking|inquiry|modification|cancellation|other",
+            "has_date": true|false,
+            "has_time": true|false,
+            "urgency": "low|medium|high",
+            "meeting_type": "meeting|call|appointment|other"
+        }}
+        """
+        
+        response = await gemini_client.aio.models.generate_content(
+            model="gemini-2.5-flash",
+            contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                temperature=0,
+                seed=42,
+                max_output_tokens=INTENT_MAX_OUTPUT_TOKENS,
+                # Thinking tokens count against the output cap and add latency
+                thinking_config=types.ThinkingConfig(thinking_budget=0)
+            )
+        )
+        
+        content = response.text
+        return json.loads(content) if content else None
+    
     async def _parse_datetime(self, state: ConversationState) -> ConversationState:
         """Parse date/time from user message"""
         try:
@@ -251,7 +321,8 @@ class BookingAgent:
             
             # Get availability from calendar service
             availability = await self.calendar_service.get_availability(start_date, end_date)
-            state.available_slots = availability
+            # Keep slots in start order so numbered replies index the list shown
+            state.available_slots = sorted(availability, key=itemgetter("start"))
             
             if availability:
                 state.step = "suggest_slots"
@@ -280,7 +351,7 @@ class BookingAgent:
             best_slots = self._find_best_slots(state)
             
             if best_slots:
-                slots_text = self._format_slots_for_user(best_slots[:3])  # Show top 3
+                slots_text = self._format_slots_for_user(best_slots)
                 state.last_response = (
                     f"I found some available times for you:\n\n{slots_text}\n\n"
                     "Which time works best for you? Just let me know the number or "
@@ -305,30 +376,28 @@ class BookingAgent:
         """Handle booking confirmation"""
         try:
             user_response = state.user_message.lower()
+            words = set(WORD_PATTERN.findall(user_response))
+            number = NUMBER_PATTERN.search(user_response)
             
             # Parse user selection
-            if any(word in user_response for word in ['yes', 'confirm', 'book', 'schedule']):
+            if CONFIRM_WORDS & words:
                 # User confirmed, proceed to booking
                 if state.available_slots:
                     state.confirmed_slot = state.available_slots[0]  # Use first suggested slot
                     state.step = "book_appointment"
                 else:
                     state.step = "error"
-            elif any(word in user_response for word in ['no', 'different', 'other', 'change']):
+            elif DECLINE_WORDS & words:
                 # User wants different time
                 state.last_response = (
                     "No problem! Please let me know what time you'd prefer, "
                     "and I'll check availability."
                 )
                 state.step = "modify"
-            elif re.search(r'\d+', user_response):
+            elif number:
                 # User selected a numbered option
                 try:
-                    match = re.search(r'\d+', user_response)
-                    if match:
-                        selection = int(match.group()) - 1
-                    else:
-                        raise ValueError("No number found")
+                    selection = int(number.group()) - 1
                     if 0 <= selection < len(state.available_slots):
                         state.confirmed_slot = state.available_slots[selection]
                         state.step = "book_appointment"
@@ -365,10 +434,9 @@ class BookingAgent:
             # Calculate end time
             start_time = state.confirmed_slot["start"]
             duration_minutes = state.duration or 60
-            end_time = (
-                datetime.fromisoformat(start_time) + 
-                timedelta(minutes=duration_minutes)
-            ).isoformat()
+            start_dt = datetime.fromisoformat(start_time)
+            end_dt = start_dt + timedelta(minutes=duration_minutes)
+            end_time = end_dt.isoformat()
             
             # Book the appointment
             event = await self.calendar_service.create_event(
@@ -378,17 +446,19 @@ class BookingAgent:
                 description=state.meeting_description or "Scheduled via AI Assistant"
             )
             
-            # Save booking to database if available
-            if self.db_manager and hasattr(self, '_current_conversation_id'):
+            # Save booking to database if available, in a worker thread since the
+            # database layer is synchronous and would otherwise block the event loop
+            if self.db_manager:
                 try:
-                    booking = self.db_manager.create_booking(
-                        conversation_id=self._current_conversation_id,
+                    booking = await asyncio.to_thread(
+                        self.db_manager.create_booking,
+                        conversation_id=_current_conversation_id.get(),
                         title=state.meeting_title,
-                        start_time=datetime.fromisoformat(start_time),
-                        end_time=datetime.fromisoformat(end_time),
+                        start_time=start_dt,
+                        end_time=end_dt,
                         description=state.meeting_description,
                         calendar_event_id=event.get('id'),
-                        extra_data={
+                        metadata={
                             'duration': duration_minutes,
                             'agent_version': 'v1.0'
                         }
@@ -428,51 +498,6 @@ class BookingAgent:
         )
         return state
     
-    def _route_intent(self, state: ConversationState) -> str:
-        """Route based on understood intent"""
-        if state.step == "error":
-            return "error"
-        elif state.intent == "booking":
-            return "parse_datetime"
-        else:
-            return "clarify"
-    
-    def _route_datetime(self, state: ConversationState) -> str:
-        """Route based on datetime parsing results"""
-        if state.step == "error":
-            return "error"
-        elif state.step == "check_availability":
-            return "check_availability"
-        else:
-            return "clarify_time"
-    
-    def _route_availability(self, state: ConversationState) -> str:
-        """Route based on availability check results"""
-        if state.step == "error":
-            return "error"
-        elif state.step == "suggest_slots":
-            return "suggest_slots"
-        else:
-            return "no_availability"
-    
-    def _route_suggestion(self, state: ConversationState) -> str:
-        """Route based on slot suggestion results"""
-        if state.step == "confirm_booking":
-            return "confirm_booking"
-        elif state.step == "alternative":
-            return "alternative"
-        else:
-            return "clarify"
-    
-    def _route_confirmation(self, state: ConversationState) -> str:
-        """Route based on confirmation response"""
-        if state.step == "book_appointment":
-            return "book_appointment"
-        elif state.step == "modify":
-            return "modify"
-        else:
-            return "cancel"
-    
     def _generate_clarification_response(self, message: str) -> str:
         """Generate appropriate clarification response"""
         return (
@@ -482,18 +507,12 @@ class BookingAgent:
             "or 'Do you have any time available this Friday afternoon?'"
         )
     
-    def _find_best_slots(self, state: ConversationState) -> List[Dict]:
+    def _find_best_slots(self, state: ConversationState, limit: int = 3) -> List[Dict]:
         """Find the best matching slots based on user preferences"""
-        if not state.available_slots:
-            return []
-        
-        # For now, return available slots sorted by start time
-        # In a more sophisticated implementation, we could score slots
-        # based on user preferences, time of day, etc.
-        return sorted(
-            state.available_slots,
-            key=lambda x: x["start"]
-        )
+        # For now, return the earliest slots; available_slots is already sorted
+        # by start time. In a more sophisticated implementation, we could score
+        # slots (e.g. heapq.nsmallest) based on user preferences, time of day, etc.
+        return state.available_slots[:limit]
     
     def _format_slots_for_user(self, slots: List[Dict]) -> str:
         """Format available slots for user display"""
@@ -503,3 +522,91 @@ class BookingAgent:
             formatted_slots.append(f"{i}. {start_time}")
         
         return "\n".join(formatted_slots)
+
+def _bind_node(method_name: str):
+    """Create a graph node that runs a method of the agent handling the current turn"""
+    async def node(state: ConversationState) -> ConversationState:
+        return await getattr(_current_agent.get(), method_name)(state)
+    return node
+
+def _route_step(state: ConversationState) -> str:
+    """Route on the step a node settled on"""
+    return state.step
+
+def _build_graph():
+    """Build the LangGraph conversation flow shared by all agents"""
+    workflow = StateGraph(ConversationState)
+    
+    # Add nodes
+    workflow.add_node("understand_intent", _bind_node("_understand_intent"))
+    workflow.add_node("parse_datetime", _bind_node("_parse_datetime"))
+    workflow.add_node("check_availability", _bind_node("_check_availability"))
+    workflow.add_node("suggest_slots", _bind_node("_suggest_slots"))
+    workflow.add_node("confirm_booking", _bind_node("_confirm_booking"))
+    workflow.add_node("book_appointment", _bind_node("_book_appointment"))
+    workflow.add_node("handle_error", _bind_node("_handle_error"))
+    
+    # Set entry point
+    workflow.set_entry_point("understand_intent")
+    
+    # Add edges; every node leaves the next step name in state.step, and
+    # each edge map covers all the steps its node can set
+    workflow.add_conditional_edges(
+        "understand_intent",
+        _route_step,
+        {
+            "parse_datetime": "parse_datetime",
+            "clarify": END,
+            "error": "handle_error"
+        }
+    )
+    
+    workflow.add_conditional_edges(
+        "parse_datetime",
+        _route_step,
+        {
+            "check_availability": "check_availability",
+            "clarify_time": END,
+            "error": "handle_error"
+        }
+    )
+    
+    workflow.add_conditional_edges(
+        "check_availability",
+        _route_step,
+        {
+            "suggest_slots": "suggest_slots",
+            "no_availability": END,
+            "error": "handle_error"
+        }
+    )
+    
+    workflow.add_conditional_edges(
+        "suggest_slots",
+        _route_step,
+        {
+            "confirm_booking": "confirm_booking",
+            "alternative": "check_availability",
+            "no_availability": END,
+            "error": END
+        }
+    )
+    
+    workflow.add_conditional_edges(
+        "confirm_booking",
+        _route_step,
+        {
+            "book_appointment": "book_appointment",
+            "modify": "parse_datetime",
+            "clarify": END,
+            "error": END
+        }
+    )
+    
+    workflow.add_edge("book_appointment", END)
+    workflow.add_edge("handle_error", END)
+    
+    return workflow.compile(checkpointer=CHECKPOINTER)
+
+# Compiled once at import; agents only bind their services per turn
+COMPILED_GRAPH = _build_graph()
@@ -1,28 +1,103 @@
 import re
-from datetime import datetime, timedelta
-from typing import Optional, Dict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Dict, Iterable, List, Tuple
 import logging
 from dateutil import parser as date_parser
 from dateutil.relativedelta import relativedelta
 
 logger = logging.getLogger(__name__)
 
+# Patterns compiled once at import
+# Relative date keywords, checked by priority once found
+RELATIVE_DATE_PATTERN = re.compile(
+    r"tomorrow|today|next week|next month"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+)
+
+WEEKDAY_PATTERN = re.compile(r"monday|tuesday|wednesday|thursday|friday|saturday|sunday")
+WEEKDAY_NUMBERS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
+    "friday": 4, "saturday": 5, "sunday": 6
+}
+
+# MM/DD/YYYY or MM-DD-YYYY, or YYYY-MM-DD, in a single pass
+DATE_PATTERN = re.compile(
+    r"(?P<mdy>\d{1,2}(?P<sep>[/-])\d{1,2}(?P=sep)\d{4})"
+    r"|(?P<ymd>\d{4}-\d{1,2}-\d{1,2})"
+)
+MDY_FORMATS = {"/": "%m/%d/%Y", "-": "%m-%d-%Y"}
+
+# Anything dateutil could read a date from: a digit, or a month or weekday name
+DATE_HINT_PATTERN = re.compile(
+    r"\d|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec"
+    r"|mon|tue|wed|thu|fri|sat|sun)"
+)
+
+TIME_PATTERN = re.compile(
+    r"(?P<clock_hour>\d{1,2}):(?P<clock_minute>\d{2})\s*(?P<clock_ampm>am|pm)?"
+    r"|(?P<ampm_hour>\d{1,2})\s*(?P<ampm>am|pm)"
+    r"|(?P<oclock_hour>\d{1,2})\s*o'?clock"
+)
+
+# Meeting type words that imply a default duration, matched as whole words
+WORD_PATTERN = re.compile(r"[a-z]+")
+SHORT_MEETING_WORDS = frozenset({"call", "calls", "quick", "brief"})
+MEETING_WORDS = frozenset({"meeting", "meetings", "session", "sessions"})
+LONG_MEETING_WORDS = frozenset({"workshop", "workshops", "training", "trainings"})
+
+# A number followed by an hour or minute unit
+DURATION_PATTERN = re.compile(r"(\d+)\s*(hours?|hrs?|minutes?|mins?)")
+
+# Business hours: Monday-Friday, 9 AM - 5 PM, as [weekday][hour] flags
+BUSINESS_HOURS = tuple(
+    tuple(weekday < 5 and 9 <= hour < 17 for hour in range(24))
+    for weekday in range(7)
+)
+
+# Days from each weekday to the next business day
+NEXT_BUSINESS_DAY_OFFSETS = tuple(
+    timedelta(days=7 - weekday if weekday >= 4 else 1) for weekday in range(7)
+)
+
 def parse_natural_language_datetime(text: str) -> Optional[Dict[str, str]]:
     """Parse natural language datetime expressions"""
+    # Results only depend on the message and today's date (times of day are
+    # always replaced), so repeated phrasings are served from the cache
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    parsed = _parse_normalized_datetime(text.lower().strip(), today)
+    return dict(parsed) if parsed else None
+
+def parse_natural_language_datetimes(texts: Iterable[str]) -> Tuple[List[Optional[datetime]], List[Optional[str]]]:
+    """Parse many datetime expressions into parallel lists of datetimes and times"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    dates, times = [], []
+    for text in texts:
+        parsed = _parse_normalized_datetime(text.lower().strip(), today)
+        if parsed:
+            dates.append(datetime.fromisoformat(parsed["date"]))
+            times.append(parsed["time"])
+        else:
+            dates.append(None)
+            times.append(None)
+    
+    return dates, times
+
+@lru_cache(maxsize=1024)
+def _parse_normalized_datetime(text: str, now: datetime) -> Optional[Dict[str, str]]:
+    """Parse a lowercased datetime expression relative to the start of today"""
     try:
-        text = text.lower().strip()
-        now = datetime.now()
-        
-        # Handle relative dates
-        if "tomorrow" in text:
+        # Handle relative dates, finding every keyword in one scan
+        keywords = set(RELATIVE_DATE_PATTERN.findall(text))
+        if "tomorrow" in keywords:
             target_date = now + timedelta(days=1)
-        elif "today" in text:
+        elif "today" in keywords:
             target_date = now
-        elif "next week" in text:
+        elif "next week" in keywords:
             target_date = now + timedelta(days=7)
-        elif "next month" in text:
+        elif "next month" in keywords:
             target_date = now + relativedelta(months=1)
-        elif any(day in text for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]):
+        elif keywords:  # Only weekday names are left
             target_date = _parse_day_of_week(text, now)
         else:
             # Try to parse absolute dates
@@ -34,19 +109,19 @@ def parse_natural_language_datetime(text: str) -> Optional[Dict[str, str]]:
         # Parse time
         time_match = _parse_time_expression(text)
         if time_match:
-            target_date = target_date.replace(
-                hour=time_match["hour"],
-                minute=time_match["minute"],
-                second=0,
-                microsecond=0
-            )
+            hour, minute = time_match
         else:
             # Default to 9 AM if no time specified
-            target_date = target_date.replace(hour=9, minute=0, second=0, microsecond=0)
+            hour, minute = 9, 0
+        
+        target_date = datetime(
+            target_date.year, target_date.month, target_date.day,
+            hour, minute, tzinfo=target_date.tzinfo
+        )
         
         return {
             "date": target_date.isoformat(),
-            "time": target_date.strftime("%H:%M")
+            "time": f"{hour:02d}:{minute:02d}"
         }
         
     except Exception as e:
@@ -55,51 +130,56 @@ def parse_natural_language_datetime(text: str) -> Optional[Dict[str, str]]:
 
 def _parse_day_of_week(text: str, reference_date: datetime) -> Optional[datetime]:
     """Parse day of week references like 'next Friday'"""
-    days = {
-        "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
-        "friday": 4, "saturday": 5, "sunday": 6
-    }
+    day_names = WEEKDAY_PATTERN.findall(text)
+    if not day_names:
+        return None
     
-    for day_name, day_num in days.items():
-        if day_name in text:
-            days_ahead = day_num - reference_date.weekday()
-            if days_ahead <= 0:  # Target day already happened this week
-                days_ahead += 7
-            
-            if "next" in text:
-                days_ahead += 7
-            
-            return reference_date + timedelta(days=days_ahead)
+    # The first weekday in week order wins, then count days to its next occurrence
+    day_num = min(WEEKDAY_NUMBERS[day_name] for day_name in day_names)
+    days_ahead = (day_num - reference_date.weekday()) % 7 or 7
     
-    return None
+    if "next" in text:
+        days_ahead += 7
+    
+    return reference_date + timedelta(days=days_ahead)
 
 def _parse_absolute_date(text: str, reference_date: datetime) -> Optional[datetime]:
     """Parse absolute date expressions"""
     try:
         # Look for date patterns
-        date_patterns = [
-            r"\d{1,2}/\d{1,2}/\d{4}",  # MM/DD/YYYY
-            r"\d{1,2}-\d{1,2}-\d{4}",  # MM-DD-YYYY
-            r"\d{4}-\d{1,2}-\d{1,2}",  # YYYY-MM-DD
-        ]
+        match = DATE_PATTERN.search(text)
+        if match:
+            if match.group("mdy"):
+                date_str = match.group("mdy")
+                date_format = MDY_FORMATS[match.group("sep")]
+            else:
+                date_str = match.group("ymd")
+                date_format = "%Y-%m-%d"
+            try:
+                return datetime.strptime(date_str, date_format)
+            except ValueError:
+                # Not a valid date in that order (e.g. day first); let dateutil decide
+                return date_parser.parse(date_str)
         
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                return date_parser.parse(match.group())
+        # Text without digits, month or weekday names cannot hold a date, so
+        # skip dateutil and the exception it would raise
+        if not DATE_HINT_PATTERN.search(text):
+            return None
         
         # Try dateutil parser for more flexible parsing
-        # Extract potential date strings
+        # Extract potential date strings, skipping windows with no date hint
         words = text.split()
         for i in range(len(words)):
             for j in range(i+1, min(i+4, len(words)+1)):
                 candidate = " ".join(words[i:j])
+                if not DATE_HINT_PATTERN.search(candidate):
+                    continue
                 try:
                     parsed = date_parser.parse(candidate, fuzzy=True)
-                    if parsed.date() >= reference_date.date():
-                        return parsed
-                except:
+                except (ValueError, OverflowError):
                     continue
+                if parsed.date() >= reference_date.date():
+                    return parsed
         
         return None
         
@@ -107,60 +187,40 @@ def _parse_absolute_date(text: str, reference_date: datetime) -> Optional[dateti
         logger.error(f"Error parsing absolute date: {str(e)}")
         return None
 
-def _parse_time_expression(text: str) -> Optional[Dict[str, int]]:
-    """Parse time expressions from text"""
+def _parse_time_expression(text: str) -> Optional[Tuple[int, int]]:
+    """Parse time expressions from lowercased text as (hour, minute)"""
     try:
-        # Common time patterns
-        time_patterns = [
-            (r"(\d{1,2}):(\d{2})\s*(am|pm)?", "exact"),
-            (r"(\d{1,2})\s*(am|pm)", "hour_ampm"),
-            (r"(\d{1,2})\s*o'?clock", "hour"),
-        ]
-        
-        for pattern, pattern_type in time_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                if pattern_type == "exact":
-                    hour = int(match.group(1))
-                    minute = int(match.group(2))
-                    ampm = match.group(3)
-                    
-                    if ampm:
-                        if ampm.lower() == "pm" and hour != 12:
-                            hour += 12
-                        elif ampm.lower() == "am" and hour == 12:
-                            hour = 0
-                    
-                    return {"hour": hour, "minute": minute}
-                
-                elif pattern_type == "hour_ampm":
-                    hour = int(match.group(1))
-                    ampm = match.group(2)
-                    
-                    if ampm.lower() == "pm" and hour != 12:
-                        hour += 12
-                    elif ampm.lower() == "am" and hour == 12:
-                        hour = 0
-                    
-                    return {"hour": hour, "minute": 0}
-                
-                elif pattern_type == "hour":
-                    hour = int(match.group(1))
-                    # Assume PM for afternoon hours if no AM/PM specified
-                    if hour < 8:
-                        hour += 12
-                    
-                    return {"hour": hour, "minute": 0}
+        # Common time patterns: H:MM with optional am/pm, H am/pm, or H o'clock
+        match = TIME_PATTERN.search(text)
+        if match:
+            if match.group("clock_hour"):
+                hour = int(match.group("clock_hour"))
+                minute = int(match.group("clock_minute"))
+                ampm = match.group("clock_ampm")
+            elif match.group("ampm_hour"):
+                hour = int(match.group("ampm_hour"))
+                minute = 0
+                ampm = match.group("ampm")
+            else:
+                hour = int(match.group("oclock_hour"))
+                # Assume PM for afternoon hours if no AM/PM specified
+                return (hour + 12 if hour < 8 else hour, 0)
+            
+            # 12 am is midnight and 12 pm is noon; other pm hours shift by 12
+            if ampm:
+                hour = hour % 12 + (12 if ampm == "pm" else 0)
+            
+            return (hour, minute)
         
         # Handle relative time expressions
         if "morning" in text:
-            return {"hour": 9, "minute": 0}
+            return (9, 0)
         elif "afternoon" in text:
-            return {"hour": 14, "minute": 0}
+            return (14, 0)
         elif "evening" in text:
-            return {"hour": 18, "minute": 0}
+            return (18, 0)
         elif "noon" in text:
-            return {"hour": 12, "minute": 0}
+            return (12, 0)
         
         return None
         
@@ -171,29 +231,21 @@ def _parse_time_expression(text: str) -> Optional[Dict[str, int]]:
 def extract_duration(text: str) -> Optional[int]:
     """Extract meeting duration from text"""
     try:
-        # Look for duration patterns
-        duration_patterns = [
-            r"(\d+)\s*hours?",
-            r"(\d+)\s*hrs?",
-            r"(\d+)\s*minutes?",
-            r"(\d+)\s*mins?",
-        ]
+        text = text.lower()
         
-        for pattern in duration_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                duration = int(match.group(1))
-                if "hour" in pattern or "hr" in pattern:
-                    return duration * 60
-                else:
-                    return duration
+        # Look for duration patterns; hour units start with "h"
+        match = DURATION_PATTERN.search(text)
+        if match:
+            duration = int(match.group(1))
+            return duration * 60 if match.group(2)[0] == "h" else duration
         
         # Default durations based on meeting type
-        if any(word in text.lower() for word in ["call", "quick", "brief"]):
+        words = set(WORD_PATTERN.findall(text))
+        if words & SHORT_MEETING_WORDS:
             return 30
-        elif any(word in text.lower() for word in ["meeting", "session"]):
+        elif words & MEETING_WORDS:
             return 60
-        elif any(word in text.lower() for word in ["workshop", "training"]):
+        elif words & LONG_MEETING_WORDS:
             return 120
         
         return None
@@ -207,25 +259,20 @@ def format_datetime_natural(iso_datetime: str) -> str:
     try:
         dt = datetime.fromisoformat(iso_datetime)
         
-        # Get day of week and date
-        day_name = dt.strftime("%A")
-        date_str = dt.strftime("%B %d, %Y")
-        
-        # Format time
-        time_str = dt.strftime("%I:%M %p").lstrip("0")
+        # Format time; the 12-hour clock hour is filled in without a leading zero
+        time_format = f"{dt.hour % 12 or 12}:%M %p"
         
         # Check if it's today, tomorrow, or this week
-        now = datetime.now()
-        days_diff = (dt.date() - now.date()).days
+        days_diff = dt.toordinal() - date.today().toordinal()
         
         if days_diff == 0:
-            return f"Today at {time_str}"
+            return dt.strftime(f"Today at {time_format}")
         elif days_diff == 1:
-            return f"Tomorrow at {time_str}"
+            return dt.strftime(f"Tomorrow at {time_format}")
         elif days_diff < 7:
-            return f"This {day_name} at {time_str}"
+            return dt.strftime(f"This %A at {time_format}")
         else:
-            return f"{day_name}, {date_str} at {time_str}"
+            return dt.strftime(f"%A, %B %d, %Y at {time_format}")
         
     except Exception as e:
         logger.error(f"Error formatting datetime: {str(e)}")
@@ -233,34 +280,20 @@ def format_datetime_natural(iso_datetime: str) -> str:
 
 def validate_business_hours(dt: datetime) -> bool:
     """Check if datetime falls within business hours"""
-    try:
-        # Business hours: Monday-Friday, 9 AM - 5 PM
-        if dt.weekday() >= 5:  # Weekend
-            return False
-        
-        if dt.hour < 9 or dt.hour >= 17:  # Outside business hours
-            return False
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error validating business hours: {str(e)}")
-        return False
+    return BUSINESS_HOURS[dt.weekday()][dt.hour]
+
+def validate_business_hours_bulk(dts: Iterable[datetime]) -> List[bool]:
+    """Check which datetimes fall within business hours"""
+    return [BUSINESS_HOURS[dt.weekday()][dt.hour] for dt in dts]
 
 def get_next_business_day(dt: datetime) -> datetime:
     """Get the next business day after given datetime"""
-    try:
-        next_day = dt + timedelta(days=1)
-        
-        # Skip weekends
-        while next_day.weekday() >= 5:
-            next_day += timedelta(days=1)
-        
-        # Set to 9 AM
-        next_day = next_day.replace(hour=9, minute=0, second=0, microsecond=0)
-        
-        return next_day
-        
-    except Exception as e:
-        logger.error(f"Error getting next business day: {str(e)}")
-        return dt
+    # Skip weekends: Friday to Sunday all roll over to Monday
+    next_day = dt + NEXT_BUSINESS_DAY_OFFSETS[dt.weekday()]
+    
+    # Set to 9 AM
+    return datetime(next_day.year, next_day.month, next_day.day, 9, tzinfo=next_day.tzinfo)
+
+def get_next_business_days_bulk(dts: Iterable[datetime]) -> List[datetime]:
+    """Get the next business day after each of the given datetimes"""
+    return [get_next_business_day(dt) for dt in dts]